@@ -1,9 +1,19 @@
 import os
+import re
 import streamlit as st
 from pathlib import Path
 import platform
 import yt_dlp
 import logging
+import time
+import threading
+import queue
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait
+import shutil
+import subprocess
+from dataclasses import dataclass
+from urllib.parse import urlparse, parse_qs
 
 # Configure logging for cloud environment
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +27,22 @@ IS_CLOUD_DEPLOYMENT = (
     os.environ.get('REPL_ID') is not None  # Replit
 )
 
+# Set YT_DLP_DEBUG=true to get yt-dlp's full console output while developing
+YT_DLP_DEBUG = os.environ.get('YT_DLP_DEBUG', 'false').lower() == 'true'
+
+# Host OS name ("Windows", "Darwin", "Linux"). Re-read on every rerun, but platform caches
+# the underlying uname() call, so this is cheap
+SYSTEM = platform.system()
+
+# Classify yt-dlp error messages in a single pass.
+# 'fatal' errors can't be fixed by switching player client, and further requests while
+# 'rate_limited' only extend the block, so both skip the remaining fallbacks.
+_DOWNLOAD_ERROR_RE = re.compile(
+    r'(?P<forbidden>\bHTTP Error 403\b|\bForbidden\b)|'
+    r'(?P<rate_limited>\bHTTP Error 429\b|\bToo Many Requests\b)|'
+    r'(?P<fatal>\bVideo unavailable\b|\bPrivate video\b|\bUnsupported URL\b|\bIncomplete YouTube ID\b|\bis not a valid URL\b)'
+)
+
 def validate_path(path: str) -> Path:
     """Validate and return a safe path for downloads."""
     try:
@@ -28,20 +54,27 @@ def validate_path(path: str) -> Path:
     except Exception:
         return Path("downloads")
 
-def check_ffmpeg():
-    """Check if ffmpeg is installed and accessible."""
+def ffmpeg_on_path() -> bool:
+    """Check whether ffmpeg can be run from PATH."""
+    # shutil.which is a plain PATH lookup, so only spawn ffmpeg when it finds nothing
+    if shutil.which('ffmpeg'):
+        return True
+    try:
+        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+@st.cache_resource(show_spinner=False)
+def find_ffmpeg(system: str):
+    """Locate ffmpeg for the given platform; cached so the probe runs once per process."""
     try:
         # In cloud environment, ffmpeg should be available via packages.txt
         if IS_CLOUD_DEPLOYMENT:
-            import subprocess
-            try:
-                subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-                return 'ffmpeg'
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                return None
+            return 'ffmpeg' if ffmpeg_on_path() else None
         
         # Local environment checks
-        if platform.system() == "Windows":
+        if system == "Windows":
             # Check in current directory and PATH
             ffmpeg_paths = [
                 Path.cwd() / "ffmpeg.exe",
@@ -51,25 +84,35 @@ def check_ffmpeg():
             for path in ffmpeg_paths:
                 if path.exists():
                     return str(path)
-            
-            # Check if available in PATH
-            import subprocess
-            try:
-                subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-                return 'ffmpeg'
-            except subprocess.CalledProcessError:
-                return None
-        else:
-            # For Linux and macOS
-            import subprocess
-            try:
-                subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-                return 'ffmpeg'
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                return None
+        
+        # Check if available in PATH (all platforms)
+        return 'ffmpeg' if ffmpeg_on_path() else None
     except Exception:
         return None
 
+def check_ffmpeg():
+    """Check if ffmpeg is installed and accessible."""
+    ffmpeg_path = find_ffmpeg(SYSTEM)
+    if ffmpeg_path is None:
+        # Don't remember a miss, so installing ffmpeg is picked up on the next run
+        find_ffmpeg.clear()
+    return ffmpeg_path
+
+def warm_up_yt_dlp():
+    """Build a throwaway YoutubeDL so extractor imports happen before the first download."""
+    try:
+        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            ydl.get_info_extractor('Youtube')
+    except Exception as e:
+        logger.warning(f"yt-dlp warm-up failed: {e}")
+
+@st.cache_resource
+def start_yt_dlp_warm_up():
+    """Start the yt-dlp warm-up in the background once per process."""
+    thread = threading.Thread(target=warm_up_yt_dlp, daemon=True)
+    thread.start()
+    return thread
+
 def show_ffmpeg_instructions():
     """Show instructions for installing ffmpeg."""
     if IS_CLOUD_DEPLOYMENT:
@@ -78,8 +121,7 @@ def show_ffmpeg_instructions():
     
     st.error("❌ FFmpeg is required but not found!")
     
-    system = platform.system()
-    if system == "Windows":
+    if SYSTEM == "Windows":
         st.markdown("""
         ### FFmpeg Installation Instructions for Windows:
         
@@ -93,7 +135,7 @@ def show_ffmpeg_instructions():
         choco install ffmpeg
         ```
         """)
-    elif system == "Darwin":  # macOS
+    elif SYSTEM == "Darwin":  # macOS
         st.markdown("""
         ### FFmpeg Installation Instructions for macOS:
         
@@ -136,6 +178,163 @@ def show_ffmpeg_instructions():
     """)
     st.stop()  # Stop the app here to prevent further execution
 
+# Extensions yt-dlp typically produces for video/audio downloads
+MEDIA_EXTENSIONS = frozenset({'.mp4', '.webm', '.mkv', '.flv', '.avi', '.mov', '.mp3', '.m4a', '.opus', '.ogg'})
+
+# Number of DASH/HLS fragments yt-dlp fetches in parallel by default
+DEFAULT_CONCURRENT_FRAGMENTS = 8
+
+# Minimum seconds between progress bar updates sent to the browser
+PROGRESS_UPDATE_INTERVAL = 0.05
+
+# Seconds to wait for a cancelled download to stop before the script run ends
+CANCEL_WAIT_TIMEOUT = 5
+
+# Seconds between redraws of an unchanged progress bar, which let a cancel take effect
+PROGRESS_HEARTBEAT_INTERVAL = 1.0
+
+# Seconds a new download waits for the session's previous download to stop
+PREVIOUS_DOWNLOAD_TIMEOUT = 30
+
+# How long a player client that returned 403 is skipped by the fallback chain
+BLOCKED_CLIENT_TTL = 4 * 60 * 60
+
+@st.cache_resource
+def get_blocked_clients() -> dict:
+    """Return the process-wide map of blocked player clients to their expiry time."""
+    return {}
+
+def is_client_blocked(client: str) -> bool:
+    """Check whether a player client is still inside its blocked window."""
+    blocked_clients = get_blocked_clients()
+    expires_at = blocked_clients.get(client)
+    if expires_at is None:
+        return False
+    if time.monotonic() >= expires_at:
+        blocked_clients.pop(client, None)
+        return False
+    return True
+
+def canonical_video_key(url: str) -> str:
+    """Return the YouTube video ID for a URL, or the stripped URL if it has none."""
+    parsed = urlparse(url.strip())
+    # hostname is lowercased and drops any port or credentials
+    host = parsed.hostname or ''
+    # Match the domain or its subdomains only, so e.g. notyoutube.com never shares a cache key
+    if host == 'youtu.be' or host.endswith('.youtu.be'):
+        video_id = parsed.path.lstrip('/').split('/')[0]
+    elif host == 'youtube.com' or host.endswith('.youtube.com'):
+        path_parts = parsed.path.strip('/').split('/')
+        if path_parts[0] in ('shorts', 'embed', 'live', 'v') and len(path_parts) > 1:
+            video_id = path_parts[1]
+        else:
+            video_id = parse_qs(parsed.query).get('v', [''])[0]
+    else:
+        video_id = ''
+    return video_id or url.strip()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def probe_video(video_key: str, _url: str, _ydl) -> dict:
+    """Extract video info without downloading; cached per video so repeat downloads skip the request."""
+    # process=False skips format selection here; it runs again when the download starts
+    info = _ydl.extract_info(_url, download=False, process=False)
+    # process=False returns redirect stubs as-is (e.g. watch?v=X&list=Y with noplaylist),
+    # so follow them until we reach the actual video
+    while info.get('_type') in ('url', 'url_transparent'):
+        info = _ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+    if info.get('_type') == 'playlist':
+        raise ValueError("Playlists are not supported. Please enter a single video URL.")
+    return _ydl.sanitize_info(info)
+
+_cancel_button_ids = itertools.count()
+
+@st.cache_resource
+def get_download_executor() -> ThreadPoolExecutor:
+    """Return the process-wide worker pool that runs blocking yt-dlp downloads."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix='yt-dlp')
+
+def wait_for_previous_download() -> bool:
+    """Wait for a download started by an earlier run of this session to stop.
+
+    Returns False if it is still running after PREVIOUS_DOWNLOAD_TIMEOUT seconds.
+    """
+    future = st.session_state.get('download_future')
+    if future is None or future.done():
+        return True
+    # It shares the session YoutubeDL, so it must finish before a new download can use it.
+    # Poll in short steps so a click can still stop this run while it waits.
+    deadline = time.monotonic() + PREVIOUS_DOWNLOAD_TIMEOUT
+    wait_box = st.empty()
+    while not future.done() and time.monotonic() < deadline:
+        remaining = int(deadline - time.monotonic()) + 1
+        wait_box.info(f"⏳ Waiting for the previous download to stop ({remaining}s)...")
+        wait([future], timeout=PROGRESS_HEARTBEAT_INTERVAL)
+    wait_box.empty()
+    return future.done()
+
+def run_download_task(task, draw_progress, cancel_event: threading.Event = None):
+    """Run a blocking download in a worker thread, redrawing progress until it finishes."""
+    future = get_download_executor().submit(task)
+    st.session_state['download_future'] = future
+    # Clicking any widget (such as this button) stops the script run, which cancels the download.
+    # Each attempt needs its own key; the counter restarts with every script run.
+    cancel_slot = st.empty()
+    cancel_slot.button("⏹️ Cancel download", key=f"cancel_download_{next(_cancel_button_ids)}")
+    try:
+        while not future.done():
+            wait([future], timeout=PROGRESS_UPDATE_INTERVAL)
+            draw_progress()
+    except BaseException:
+        # The script run was stopped (e.g. a widget was clicked); tell the worker to stop too,
+        # and give it a moment so temp cleanup doesn't race with its writes
+        if cancel_event is not None:
+            cancel_event.set()
+        # A task still queued behind other sessions' downloads must not start at all
+        if not future.cancel():
+            wait([future], timeout=CANCEL_WAIT_TIMEOUT)
+        raise
+    cancel_slot.empty()
+    draw_progress()
+    # Re-raises any exception from the worker so callers can fall back as before
+    return future.result()
+
+def classify_download_error(error) -> str:
+    """Return the error class name for a download error, or None if unrecognised."""
+    match = _DOWNLOAD_ERROR_RE.search(str(error))
+    return match.lastgroup if match else None
+
+def find_latest_download(directory: Path):
+    """Return the most recently modified media file in a directory, falling back to any file."""
+    media_files = []
+    other_files = []
+    # One directory pass; DirEntry caches file type and stat results
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # Skip hidden files such as .DS_Store
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            if os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS:
+                media_files.append(entry)
+            else:
+                other_files.append(entry)
+    
+    files = media_files or other_files
+    if not files:
+        return None
+    latest = max(files, key=lambda e: e.stat().st_mtime)
+    return Path(latest.path)
+
+def merge_ydl_opts(base: dict, overrides: dict) -> dict:
+    """Build a new yt-dlp options dict from base options and per-attempt overrides."""
+    merged = {**base, **overrides}
+    # Merge extractor_args per extractor so the override never shares or mutates the base dict
+    if 'extractor_args' in base or 'extractor_args' in overrides:
+        merged['extractor_args'] = {
+            **base.get('extractor_args', {}),
+            **overrides.get('extractor_args', {}),
+        }
+    return merged
+
 def select_best_format_with_audio(formats, quality=None):
     """Manually select the best format that has both video and audio."""
     # Filter formats that have both video and audio
@@ -167,7 +366,173 @@ def select_best_format_with_audio(formats, quality=None):
     
     return combined_formats[0] if combined_formats else None
 
-def download_content(url: str, output_path: str, download_type: str = 'video', quality: int = None, download_folder: str = None):
+def build_format_options(download_type: str, quality: int = None) -> dict:
+    """Return the format-related yt-dlp options for a download type and quality."""
+    # Configure format based on download type with more robust selection
+    if download_type == 'audio':
+        return {
+            'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
+            # m4a keeps the AAC stream from the preferred m4a format as-is (no transcode);
+            # other sources are converted to AAC at the given quality
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'm4a',
+                'preferredquality': '192',
+            }],
+        }
+    else:  # video
+        # bv* + ba merges the best video with the best audio; b is the best single file
+        # with both. Either way the result always has audio.
+        if quality:
+            format_selector = f'bv*[height<={quality}]+ba/b[height<={quality}]'
+        else:
+            format_selector = 'bv*+ba/b'
+        
+        # Resolution must come first: user sort fields outrank yt-dlp's defaults, so without it
+        # "Best" would pick a 360p mp4. Among equal resolutions, prefer H.264/AAC in mp4/m4a
+        # so merging into mp4 is a plain stream copy.
+        format_sort = [f'res:{quality}' if quality else 'res', 'ext:mp4:m4a', 'codec:avc1:mp4a']
+        
+        # Configure format and ensure proper merging
+        return {
+            'format': format_selector,
+            'format_sort': format_sort,
+            'merge_output_format': 'mp4',
+        }
+
+def build_fallback_format(quality: int = None) -> str:
+    """Return the format selector used by the client fallbacks for a video quality."""
+    # Build quality-aware format selector for fallbacks with explicit audio requirement
+    quality_suffix = f'[height<={quality}]' if quality else ''
+    return (
+        f'best{quality_suffix}[acodec!=none][vcodec!=none][ext=mp4]/'  # Best combined mp4 with audio
+        f'best{quality_suffix}[acodec!=none][vcodec!=none]/'  # Best combined with audio
+        f'bestvideo{quality_suffix}[vcodec!=none]+bestaudio[acodec!=none]/'  # Merge video+audio
+        f'bestvideo{quality_suffix}[vcodec!=none]+bestaudio[acodec!=none][ext=m4a]/'  # Merge with m4a
+        'bestvideo[vcodec!=none]+bestaudio[acodec!=none]/best[acodec!=none][vcodec!=none]'  # Final fallbacks
+    )
+
+# Video quality choices offered in the UI (None = best available)
+VIDEO_QUALITIES = [None, 240, 360, 480, 720, 1080]
+
+@st.cache_resource
+def get_format_options() -> dict:
+    """Return format options for every choice the UI offers, built once per server process.
+
+    Shared across sessions, so callers must copy rather than mutate the returned dicts.
+    """
+    format_options = {('video', quality): build_format_options('video', quality) for quality in VIDEO_QUALITIES}
+    format_options[('audio', None)] = build_format_options('audio')
+    return format_options
+
+@st.cache_resource
+def get_fallback_formats() -> dict:
+    """Return the fallback format selector for every UI quality, built once per server process."""
+    return {quality: build_fallback_format(quality) for quality in VIDEO_QUALITIES}
+
+@st.cache_resource
+def get_base_ydl_opts() -> dict:
+    """Return the yt-dlp options shared by every download, built once per server process.
+
+    build_ydl_opts layers the per-download values on top; the dict is shared across
+    sessions, so callers must copy rather than mutate it.
+    """
+    # Improved settings for better compatibility
+    return {
+        # Console output goes through Streamlit's log capture; progress_hooks already drive the UI
+        'quiet': not YT_DLP_DEBUG,
+        'no_warnings': not YT_DLP_DEBUG,
+        'verbose': YT_DLP_DEBUG,
+        'prefer_ffmpeg': True,
+        'ignoreerrors': False,
+        'nooverwrites': False,
+        'writesubtitles': False,
+        'writeautomaticsub': False,
+        'skip_unavailable_fragments': True,
+        'ignore_no_formats_error': False,  # Changed to False to catch errors properly
+        'extractor_retries': 5,
+        'fragment_retries': 10,
+        'retries': 10,
+        'socket_timeout': 30,
+        # Request progressive streams in large ranges
+        'http_chunk_size': 10 * 1024 * 1024,
+        # Start reads at 1 MiB rather than 1 KiB; with noresizebuffer off, yt-dlp still grows or
+        # shrinks the read size from the measured rate, so this only skips the slow ramp-up
+        'buffersize': 1024 * 1024,
+        'noresizebuffer': False,
+        'extract_flat': False,
+        # A watch URL with &list= means "this video", not the whole playlist
+        'noplaylist': True,
+        # Use multiple clients to get best format availability
+        # iOS and Android clients often have better format options
+        'extractor_args': {
+            'youtube': {
+                'player_client': ['ios', 'android', 'web'],  # Try ios first (best formats), then android, then web
+                'player_skip': ['webpage', 'configs'],
+            }
+        },
+        # Add user agent and cookies to avoid 403 errors
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        },
+        # Don't force external downloader - let yt-dlp handle merging properly
+        # Only use ffmpeg for HLS streams if needed
+        'external_downloader_args': {
+            'ffmpeg': ['-timeout', '30000000']  # 30 second timeout
+        }
+    }
+
+@dataclass(frozen=True)
+class DownloadSpec:
+    """Everything that determines the yt-dlp options for one download."""
+    output_template: str
+    download_type: str = 'video'
+    quality: int = None
+    ffmpeg_path: str = 'ffmpeg'
+    concurrent_fragments: int = DEFAULT_CONCURRENT_FRAGMENTS
+
+def build_ydl_opts(spec: DownloadSpec) -> dict:
+    """Build the base yt-dlp options for a download; fallback attempts merge on top of these."""
+    ydl_opts = {
+        **get_base_ydl_opts(),
+        'outtmpl': spec.output_template,
+        # Fetch fragments in parallel
+        'concurrent_fragment_downloads': spec.concurrent_fragments,
+    }
+
+    # Only set ffmpeg_location if it's a specific path, not just 'ffmpeg'
+    if spec.ffmpeg_path != 'ffmpeg':
+        ydl_opts['ffmpeg_location'] = spec.ffmpeg_path
+
+    # Configure format based on download type; quality only applies to video
+    format_key = (spec.download_type, None if spec.download_type == 'audio' else spec.quality)
+    format_options = get_format_options().get(format_key) or build_format_options(*format_key)
+    ydl_opts.update(format_options)
+
+    return ydl_opts
+
+def get_session_ydl(ydl_opts: dict, progress_hook):
+    """Return a YoutubeDL for these options, reused across downloads in this session."""
+    base_opts = {k: v for k, v in ydl_opts.items() if k != 'progress_hooks'}
+    key = repr(sorted(base_opts.items()))
+    cached = st.session_state.get('session_ydl')
+    if cached is None or cached[0] != key:
+        # Only one instance is kept per session; close the old one so its connections are released
+        if cached is not None:
+            cached[1].close()
+        # The instance outlives a single download, so route progress through a swappable hook
+        hook_slot = {}
+        def forward_progress(d):
+            hook = hook_slot.get('hook')
+            if hook:
+                hook(d)
+        ydl = yt_dlp.YoutubeDL({**base_opts, 'progress_hooks': [forward_progress]})
+        cached = st.session_state['session_ydl'] = (key, ydl, hook_slot)
+    _, ydl, hook_slot = cached
+    hook_slot['hook'] = progress_hook
+    return ydl
+
+def download_content(url: str, output_path: str, download_type: str = 'video', quality: int = None, download_folder: str = None, concurrent_fragments: int = DEFAULT_CONCURRENT_FRAGMENTS):
     """Download video or audio content."""
     ffmpeg_path = check_ffmpeg()
     if not ffmpeg_path:
@@ -185,15 +550,19 @@ def download_content(url: str, output_path: str, download_type: str = 'video', q
             temp_dir = Path("temp_downloads").resolve()
             is_custom_folder = False
         
-        # Ensure directory exists
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        # Ensure directory exists (it usually does, so check before walking the path with mkdir)
+        if not temp_dir.is_dir():
+            temp_dir.mkdir(parents=True, exist_ok=True)
         
         # Progress tracking
+        # Bar and label share one element so each update is a single delta
         progress_bar = st.progress(0)
-        status_text = st.empty()
+        # Single placeholder for transient status messages so they update in place
+        status_box = st.empty()
         downloaded_file = None
+        # Set when the script run is stopped mid-download (see run_download_task)
+        cancel_event = threading.Event()
 
-        # Configure yt-dlp options with improved settings for better compatibility
         # Use absolute path for output template
         output_template = str(temp_dir / '%(title)s.%(ext)s')
         logger.info(f"Download location: {temp_dir}")
@@ -201,94 +570,25 @@ def download_content(url: str, output_path: str, download_type: str = 'video', q
         if is_custom_folder:
             st.info(f"📁 Files will be saved to: {temp_dir}")
         
-        ydl_opts = {
-            'outtmpl': output_template,
-            'quiet': False,
-            'no_warnings': False,
-            'progress': True,
-            'prefer_ffmpeg': True,
-            'ignoreerrors': False,
-            'nooverwrites': False,
-            'writesubtitles': False,
-            'writeautomaticsub': False,
-            'skip_unavailable_fragments': True,
-            'ignore_no_formats_error': False,  # Changed to False to catch errors properly
-            'extractor_retries': 5,
-            'fragment_retries': 5,
-            'retries': 5,
-            'socket_timeout': 30,
-            'extract_flat': False,
-            # Use multiple clients to get best format availability
-            # iOS and Android clients often have better format options
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['ios', 'android', 'web'],  # Try ios first (best formats), then android, then web
-                    'player_skip': ['webpage', 'configs'],
-                }
-            },
-            # Add user agent and cookies to avoid 403 errors
-            'http_headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            },
-            # Don't force external downloader - let yt-dlp handle merging properly
-            # Only use ffmpeg for HLS streams if needed
-            'external_downloader_args': {
-                'ffmpeg': ['-timeout', '30000000']  # 30 second timeout
-            }
-        }
-
-        # Only set ffmpeg_location if it's a specific path, not just 'ffmpeg'
-        if ffmpeg_path != 'ffmpeg':
-            ydl_opts['ffmpeg_location'] = ffmpeg_path
-
-        # Configure format based on download type with more robust selection
-        if download_type == 'audio':
-            ydl_opts.update({
-                'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-            })
-        else:  # video
-            # CRITICAL: Use format selector that EXPLICITLY requires audio
-            # Format syntax: acodec!=none means format MUST have audio
-            if quality:
-                # Prioritize combined formats with audio at specified quality
-                format_selector = (
-                    f'best[height<={quality}][acodec!=none][vcodec!=none][ext=mp4]/'  # Best combined mp4 with audio
-                    f'best[height<={quality}][acodec!=none][vcodec!=none]/'  # Best combined with audio (any ext)
-                    f'bestvideo[height<={quality}][vcodec!=none]+bestaudio[acodec!=none]/'  # Merge video + audio
-                    f'bestvideo[height<={quality}][vcodec!=none]+bestaudio[acodec!=none][ext=m4a]/'  # Merge with m4a
-                    f'bestvideo[height<={quality}][vcodec!=none]+bestaudio[acodec!=none][ext=webm]/'  # Merge with webm
-                    f'worst[height<={quality}][acodec!=none][vcodec!=none]'  # Worst but with audio
-                )
-            else:
-                # For best quality: explicitly require audio in all formats
-                format_selector = (
-                    'best[acodec!=none][vcodec!=none][ext=mp4]/'  # Best combined mp4 with audio
-                    'best[acodec!=none][vcodec!=none]/'  # Best combined with audio (any ext)
-                    'bestvideo[vcodec!=none]+bestaudio[acodec!=none]/'  # Merge best video + best audio
-                    'bestvideo[vcodec!=none][ext=mp4]+bestaudio[acodec!=none][ext=m4a]/'  # Merge mp4 + m4a
-                    'bestvideo[vcodec!=none]+bestaudio[acodec!=none][ext=m4a]/'  # Best video + m4a audio
-                    'bestvideo[vcodec!=none]+bestaudio[acodec!=none][ext=webm]/'  # Best video + webm audio
-                    'best[acodec!=none][vcodec!=none]'  # Final fallback with audio
-                )
-            
-            # Configure format and ensure proper merging
-            ydl_opts.update({
-                'format': format_selector,
-                'merge_output_format': 'mp4',
-            })
+        spec = DownloadSpec(
+            output_template=output_template,
+            download_type=download_type,
+            quality=quality,
+            ffmpeg_path=ffmpeg_path,
+            concurrent_fragments=concurrent_fragments,
+        )
+        ydl_opts = build_ydl_opts(spec)
 
         def cleanup_temp_files():
             """Clean up temporary files after download"""
             try:
                 # Only cleanup if using default temp directory (not custom folder)
                 if not is_custom_folder:
-                    if downloaded_file and os.path.exists(downloaded_file):
-                        os.remove(downloaded_file)
+                    if downloaded_file:
+                        try:
+                            os.remove(downloaded_file)
+                        except FileNotFoundError:
+                            pass
                     if temp_dir.exists() and temp_dir.name == "temp_downloads":
                         for file in temp_dir.glob('*'):
                             try:
@@ -302,285 +602,322 @@ def download_content(url: str, output_path: str, download_type: str = 'video', q
             except Exception as e:
                 logger.warning(f"Cleanup error: {e}")
 
+        # yt-dlp runs in a worker thread (see run_download_task) and may call the hook from
+        # its own fragment threads, so the hook only publishes state; the script thread draws it.
+        # A one-slot queue keeps just the newest state, so a slow UI never holds up the download.
+        progress_updates = queue.Queue(maxsize=1)
+        last_percent = -1
+        last_status_file = None
+        last_bar = (0, None)
+        last_draw_time = time.monotonic()
+
+        def publish_progress(update):
+            """Replace any undrawn progress state with the newest one without blocking."""
+            while True:
+                try:
+                    progress_updates.put_nowait(update)
+                    return
+                except queue.Full:
+                    try:
+                        progress_updates.get_nowait()
+                    except queue.Empty:
+                        pass
+
         def progress_hook(d):
             nonlocal downloaded_file
+            if cancel_event.is_set():
+                raise yt_dlp.utils.DownloadCancelled('Download cancelled by user')
             if d['status'] == 'downloading':
                 try:
                     total = d.get('total_bytes', 0) or d.get('total_bytes_estimate', 0)
                     downloaded = d.get('downloaded_bytes', 0)
                     if total:
                         progress = min(downloaded / total, 1.0)
-                        progress_bar.progress(progress)
                         filename = os.path.basename(d.get('filename', ''))
-                        status_text.text(f"⏳ Downloading: {filename}")
+                        publish_progress((progress, filename, False))
                 except Exception as e:
                     logger.warning(f"Progress calculation error: {e}")
             elif d['status'] == 'finished':
                 downloaded_file = d.get('filename', '')
-                filename = os.path.basename(downloaded_file)
-                status_text.text(f"✅ Processing: {filename}")
-                progress_bar.progress(1.0)
+                publish_progress((1.0, os.path.basename(downloaded_file), True))
+
+        def draw_progress():
+            """Render the latest published progress state; called from the script thread."""
+            nonlocal last_percent, last_status_file, last_bar, last_draw_time
+
+            def render(progress, text):
+                nonlocal last_bar, last_draw_time
+                progress_bar.progress(progress, text=text)
+                last_bar = (progress, text)
+                last_draw_time = time.monotonic()
+
+            try:
+                progress, filename, finished = progress_updates.get_nowait()
+            except queue.Empty:
+                progress, filename, finished = None, None, False
+            if finished:
+                render(1.0, f"✅ Processing: {filename}")
+                # Reset so the next stream (e.g. audio after video) starts drawing immediately
+                last_percent = -1
+                last_status_file = None
+                return
+            # Only send an update when the visible percentage or file changes
+            if progress is not None:
+                percent = int(progress * 100)
+                if percent != last_percent or filename != last_status_file:
+                    render(progress, f"⏳ Downloading: {filename}")
+                    last_percent = percent
+                    last_status_file = filename
+                    return
+            # Streamlit only acts on a stop request (e.g. the cancel button) inside an st.* call,
+            # so redraw the unchanged bar now and then; otherwise cancelling does nothing during
+            # a stall or while ffmpeg merges
+            if time.monotonic() - last_draw_time >= PROGRESS_HEARTBEAT_INTERVAL:
+                render(*last_bar)
 
         ydl_opts['progress_hooks'] = [progress_hook]
 
         try:
-            # First, extract info to validate URL and select best format
-            info_opts = ydl_opts.copy()
-            info_opts['quiet'] = True
-            info_opts['no_warnings'] = True
+            # One YoutubeDL instance: extract info once, then download from that same info.
+            # The instance is kept in the session so later downloads skip yt-dlp's setup cost.
+            if not wait_for_previous_download():
+                status_box.error("❌ The previous download is still stopping. Please try again in a moment.")
+                return False
+            ydl = get_session_ydl(ydl_opts, progress_hook)
             
-            with yt_dlp.YoutubeDL(info_opts) as info_ydl:
-                try:
-                    info = info_ydl.extract_info(url, download=False)
-                    title = info.get('title', 'Unknown')
-                    st.write(f"📥 Starting download for: {title}")
+            # First, extract info to validate URL and select best format
+            try:
+                info = probe_video(canonical_video_key(url), url, ydl)
+                title = info.get('title', 'Unknown')
+                # Collect the summary and render it as a single element
+                summary_lines = [f"📥 Starting download for: {title}"]
+                
+                # Check available formats and log them for debugging
+                formats = info.get('formats', [])
+                if formats:
+                    summary_lines.append(f"📊 Found {len(formats)} available formats")
+                    # Show formats with audio info
+                    video_formats = [f for f in formats if f.get('vcodec') != 'none']
+                    audio_formats = [f for f in formats if f.get('acodec') != 'none']
+                    combined_formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none']
                     
-                    # Check available formats and log them for debugging
-                    formats = info.get('formats', [])
-                    if formats:
-                        st.info(f"📊 Found {len(formats)} available formats")
-                        # Show formats with audio info
-                        video_formats = [f for f in formats if f.get('vcodec') != 'none']
-                        audio_formats = [f for f in formats if f.get('acodec') != 'none']
-                        combined_formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none']
-                        
-                        st.write(f"  📹 Video-only: {len(video_formats)} | 🎵 Audio-only: {len(audio_formats)} | 🎬 Video+Audio: {len(combined_formats)}")
-                        
-                        # Show best combined formats available
-                        if combined_formats:
-                            best_combined = sorted(combined_formats, key=lambda x: x.get('height', 0) or 0, reverse=True)[:3]
-                            st.write("  🎯 Best combined formats available:")
-                            for fmt in best_combined:
-                                res = fmt.get('resolution', fmt.get('height', 'N/A'))
-                                ext = fmt.get('ext', 'N/A')
-                                st.write(f"    - {fmt.get('format_id', 'N/A')}: {res} ({ext})")
-                        
-                        # Manually select best format with audio if available
-                        # This ensures we always get a format with audio
-                        best_format = select_best_format_with_audio(formats, quality)
-                        if best_format:
-                            format_id = best_format.get('format_id')
-                            height = best_format.get('height', 'N/A')
-                            ext = best_format.get('ext', 'mp4')
-                            st.success(f"  ✅ Found best format: {format_id} ({height}p, {ext}) - has video and audio")
-                            # Don't override format selector - let yt-dlp handle format selection
-                            # The format selector will naturally pick this format if available
-                            # Overriding with specific format ID can cause "format not available" errors
-                        else:
-                            st.warning("  ⚠️ Could not find combined format, will use format selector (may need merging)")
+                    summary_lines.append(f"📹 Video-only: {len(video_formats)} | 🎵 Audio-only: {len(audio_formats)} | 🎬 Video+Audio: {len(combined_formats)}")
                     
-                except Exception as e:
-                    st.error(f"❌ Error extracting video info: {str(e)}")
-                    logger.error(f"Info extraction error: {e}")
-                    return False
+                    # Show best combined formats available
+                    if combined_formats:
+                        best_combined = sorted(combined_formats, key=lambda x: x.get('height', 0) or 0, reverse=True)[:3]
+                        summary_lines.append("🎯 Best combined formats available:")
+                        for fmt in best_combined:
+                            res = fmt.get('resolution', fmt.get('height', 'N/A'))
+                            ext = fmt.get('ext', 'N/A')
+                            summary_lines.append(f"- {fmt.get('format_id', 'N/A')}: {res} ({ext})")
+                    
+                    # Manually select best format with audio if available
+                    # This ensures we always get a format with audio
+                    best_format = select_best_format_with_audio(formats, quality)
+                    if best_format:
+                        format_id = best_format.get('format_id')
+                        height = best_format.get('height', 'N/A')
+                        ext = best_format.get('ext', 'mp4')
+                        summary_lines.append(f"✅ Found best format: {format_id} ({height}p, {ext}) - has video and audio")
+                        # Don't override format selector - let yt-dlp handle format selection
+                        # The format selector will naturally pick this format if available
+                        # Overriding with specific format ID can cause "format not available" errors
+                    else:
+                        summary_lines.append("⚠️ Could not find combined format, will use format selector (may need merging)")
+                
+                st.markdown("  \n".join(summary_lines))
+                
+            except Exception as e:
+                st.error(f"❌ Error extracting video info: {str(e)}")
+                logger.error(f"Info extraction error: {e}")
+                return False
             
-            # Now perform the actual download with the selected format
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            # Perform the actual download, reusing the already extracted info
+            download_success = False
+            try:
+                run_download_task(lambda: ydl.process_ie_result(info, download=True), draw_progress, cancel_event)
+                download_success = True
+            except Exception as e:
+                error_msg = str(e)
+                status_box.warning(f"⚠️ Initial download attempt failed: {error_msg}")
+                logger.warning(f"Download error: {e}")
                 
-                # Perform the actual download
-                download_success = False
-                try:
-                    ydl.download([url])
-                    download_success = True
-                except Exception as e:
-                    error_msg = str(e)
-                    st.warning(f"⚠️ Initial download attempt failed: {error_msg}")
-                    logger.warning(f"Download error: {e}")
-                    
-                    # Try multiple fallback approaches - all ensure video with audio
-                    # Build quality-aware format selector for fallbacks with explicit audio requirement
-                    quality_suffix = f'[height<={quality}]' if quality else ''
-                    fallback_format = (
-                        f'best{quality_suffix}[acodec!=none][vcodec!=none][ext=mp4]/'  # Best combined mp4 with audio
-                        f'best{quality_suffix}[acodec!=none][vcodec!=none]/'  # Best combined with audio
-                        f'bestvideo{quality_suffix}[vcodec!=none]+bestaudio[acodec!=none]/'  # Merge video+audio
-                        f'bestvideo{quality_suffix}[vcodec!=none]+bestaudio[acodec!=none][ext=m4a]/'  # Merge with m4a
-                        'bestvideo[vcodec!=none]+bestaudio[acodec!=none]/best[acodec!=none][vcodec!=none]'  # Final fallbacks
-                    )
-                    
-                    fallback_methods = [
-                        {
-                            'name': 'iOS client with video+audio',
-                            'opts': {
-                                'extractor_args': {
-                                    'youtube': {
-                                        'player_client': ['ios'],
-                                    }
-                                },
-                                'format': fallback_format,
-                                'merge_output_format': 'mp4',
-                                'external_downloader': None,
-                            }
-                        },
-                        {
-                            'name': 'Android client with video+audio',
-                            'opts': {
-                                'extractor_args': {
-                                    'youtube': {
-                                        'player_client': ['android'],
-                                    }
-                                },
-                                'format': fallback_format,
-                                'merge_output_format': 'mp4',
-                                'external_downloader': None,
-                            }
-                        },
-                        {
-                            'name': 'Web client with video+audio',
-                            'opts': {
-                                'extractor_args': {
-                                    'youtube': {
-                                        'player_client': ['web'],
-                                    }
-                                },
-                                'format': fallback_format,
-                                'merge_output_format': 'mp4',
-                                'external_downloader': None,
-                            }
-                        },
-                        {
-                            'name': 'Any available format with audio',
-                            'opts': {
-                                'format': 'bestvideo+bestaudio/best/worst',
-                                'merge_output_format': 'mp4',
-                                'ignore_no_formats_error': True,
-                                'external_downloader': None,
-                            }
+                # No player client can recover from these, so don't waste time on fallbacks
+                error_class = classify_download_error(e)
+                if error_class == 'rate_limited':
+                    st.error(f"❌ YouTube is rate limiting requests: {error_msg}")
+                    st.info("💡 Wait a few minutes before trying again.")
+                    return False
+                if error_class == 'fatal':
+                    st.error(f"❌ Download failed: {error_msg}")
+                    return False
+                
+                # Try multiple fallback approaches - all ensure video with audio
+                fallback_format = get_fallback_formats().get(quality) or build_fallback_format(quality)
+                
+                fallback_methods = [
+                    {
+                        'name': 'iOS client with video+audio',
+                        'client': 'ios',
+                        'opts': {
+                            'extractor_args': {
+                                'youtube': {
+                                    'player_client': ['ios'],
+                                }
+                            },
+                            'format': fallback_format,
+                            'merge_output_format': 'mp4',
+                            'external_downloader': None,
                         }
-                    ]
-                    
-                    for i, method in enumerate(fallback_methods):
-                        try:
-                            st.info(f"🔄 Trying fallback method {i+1}/{len(fallback_methods)}: {method['name']}...")
-                            fallback_opts = ydl_opts.copy()
-                            fallback_opts.update(method['opts'])
-                            
-                            with yt_dlp.YoutubeDL(fallback_opts) as fallback_ydl:
-                                fallback_ydl.download([url])
-                            download_success = True
-                            st.success(f"✅ Success with fallback method: {method['name']}")
-                            break
-                        except Exception as fallback_e:
-                            logger.warning(f"Fallback method {i+1} failed: {fallback_e}")
-                            if i == len(fallback_methods) - 1:
-                                st.error(f"❌ All download methods failed. Last error: {str(fallback_e)}")
-                                st.info("💡 Try updating yt-dlp: `pip install --upgrade yt-dlp`")
-                                return False
+                    },
+                    {
+                        'name': 'Android client with video+audio',
+                        'client': 'android',
+                        'opts': {
+                            'extractor_args': {
+                                'youtube': {
+                                    'player_client': ['android'],
+                                }
+                            },
+                            'format': fallback_format,
+                            'merge_output_format': 'mp4',
+                            'external_downloader': None,
+                        }
+                    },
+                    {
+                        'name': 'Web client with video+audio',
+                        'client': 'web',
+                        'opts': {
+                            'extractor_args': {
+                                'youtube': {
+                                    'player_client': ['web'],
+                                }
+                            },
+                            'format': fallback_format,
+                            'merge_output_format': 'mp4',
+                            'external_downloader': None,
+                        }
+                    },
+                    {
+                        'name': 'Any available format with audio',
+                        'opts': {
+                            'format': 'bestvideo+bestaudio/best/worst',
+                            'merge_output_format': 'mp4',
+                            'ignore_no_formats_error': True,
+                            'external_downloader': None,
+                        }
+                    }
+                ]
+                
+                # Skip player clients that were recently blocked from this deployment
+                fallback_methods = [
+                    m for m in fallback_methods
+                    if not (m.get('client') and is_client_blocked(m['client']))
+                ]
                 
-                # Check for downloaded file in download directory
-                if not downloaded_file:
-                    # Try to find the most recently created file in temp_dir
+                for i, method in enumerate(fallback_methods):
                     try:
-                        # Look for video/audio files (common extensions)
-                        video_extensions = ['*.mp4', '*.webm', '*.mkv', '*.flv', '*.avi', '*.mov', '*.mp3', '*.m4a', '*.opus', '*.ogg']
-                        files = []
-                        for ext in video_extensions:
-                            files.extend(temp_dir.glob(ext))
+                        status_box.info(f"🔄 Trying fallback method {i+1}/{len(fallback_methods)}: {method['name']}...")
+                        fallback_opts = merge_ydl_opts(ydl_opts, method['opts'])
                         
-                        if files:
-                            # Get the most recently modified file
-                            downloaded_file = max(files, key=lambda p: p.stat().st_mtime)
-                            downloaded_file = str(downloaded_file.resolve())
-                        else:
-                            # Fallback: check all files
-                            all_files = [f for f in temp_dir.glob('*') if f.is_file()]
-                            if all_files:
-                                downloaded_file = max(all_files, key=lambda p: p.stat().st_mtime)
-                                downloaded_file = str(downloaded_file.resolve())
-                    except Exception as e:
-                        logger.warning(f"Could not find downloaded file: {e}")
-                
-                # Resolve file path to absolute
-                if downloaded_file:
-                    downloaded_file = str(Path(downloaded_file).resolve())
-                
-                if downloaded_file and os.path.exists(downloaded_file):
-                    file_size = os.path.getsize(downloaded_file) / (1024 * 1024)  # Convert to MB
-                    file_name = os.path.basename(downloaded_file)
-                    file_path = str(Path(downloaded_file).parent)
-                    
-                    # Show success message with file location
-                    if is_custom_folder:
-                        st.success(f"✅ Download completed! File saved to:")
-                        st.info(f"📁 Location: {file_path}")
-                        st.info(f"📄 File: {file_name} ({file_size:.1f} MB)")
-                        # Also provide download button for convenience
-                        try:
-                            with open(downloaded_file, 'rb') as f:
-                                file_data = f.read()
-                            st.download_button(
-                                label=f"⬇️ Download {file_name} ({file_size:.1f} MB)",
-                                data=file_data,
-                                file_name=file_name,
-                                mime='application/octet-stream'
-                            )
-                        except Exception as e:
-                            logger.warning(f"Could not create download button: {e}")
-                    else:
-                        # Create download button for temp files
-                        with open(downloaded_file, 'rb') as f:
-                            file_data = f.read()
+                        def download_with_fallback():
+                            with yt_dlp.YoutubeDL(fallback_opts) as fallback_ydl:
+                                fallback_ydl.download([url])
                         
+                        run_download_task(download_with_fallback, draw_progress, cancel_event)
+                        download_success = True
+                        status_box.success(f"✅ Success with fallback method: {method['name']}")
+                        break
+                    except Exception as fallback_e:
+                        logger.warning(f"Fallback method {i+1} failed: {fallback_e}")
+                        error_class = classify_download_error(fallback_e)
+                        if error_class == 'forbidden' and method.get('client'):
+                            get_blocked_clients()[method['client']] = time.monotonic() + BLOCKED_CLIENT_TTL
+                        if error_class == 'rate_limited':
+                            st.error(f"❌ YouTube is rate limiting requests: {str(fallback_e)}")
+                            st.info("💡 Wait a few minutes before trying again.")
+                            return False
+                        if error_class == 'fatal' or i == len(fallback_methods) - 1:
+                            st.error(f"❌ All download methods failed. Last error: {str(fallback_e)}")
+                            st.info("💡 Try updating yt-dlp: `pip install --upgrade yt-dlp`")
+                            return False
+            
+            # Check for downloaded file in download directory
+            if not downloaded_file:
+                # Try to find the most recently created file in temp_dir
+                try:
+                    latest_file = find_latest_download(temp_dir)
+                    if latest_file:
+                        # temp_dir is already resolved, so entries under it are absolute
+                        downloaded_file = str(latest_file)
+                except Exception as e:
+                    logger.warning(f"Could not find downloaded file: {e}")
+            
+            # Make file path absolute (string operation only, no filesystem walk)
+            if downloaded_file:
+                downloaded_file = os.path.abspath(downloaded_file)
+            
+            # One stat both confirms the file exists and gives its size
+            downloaded_size = None
+            if downloaded_file:
+                try:
+                    downloaded_size = os.stat(downloaded_file).st_size
+                except OSError:
+                    pass
+            
+            if downloaded_size is not None:
+                downloaded_path = Path(downloaded_file)
+                file_size = downloaded_size / (1024 * 1024)  # Convert to MB
+                file_name = downloaded_path.name
+                file_path = str(downloaded_path.parent)
+                
+                # Show success message with file location
+                if is_custom_folder:
+                    st.success(f"✅ Download completed! File saved to:")
+                    st.info(f"📁 Location: {file_path}")
+                    st.info(f"📄 File: {file_name} ({file_size:.1f} MB)")
+                    # File is already saved locally - no need to push it through the browser
+                else:
+                    # Create download button for temp files
+                    # Streamlit reads the whole file into memory either way; the with block just
+                    # makes sure the handle is closed before the temp files are cleaned up
+                    with open(downloaded_file, 'rb') as f:
                         st.download_button(
                             label=f"⬇️ Download {file_name} ({file_size:.1f} MB)",
-                            data=file_data,
+                            data=f,
                             file_name=file_name,
                             mime='application/octet-stream'
                         )
-                        st.info(f"💡 File temporarily saved to: {file_path}")
-                    
-                    return True
-                elif download_success:
-                    # Download reported success but file not found - search more thoroughly
-                    st.warning("⚠️ Download reported success but file location unclear. Searching...")
-                    try:
-                        # Search for video/audio files
-                        video_extensions = ['*.mp4', '*.webm', '*.mkv', '*.flv', '*.avi', '*.mov', '*.mp3', '*.m4a', '*.opus', '*.ogg']
-                        files = []
-                        for ext in video_extensions:
-                            files.extend(temp_dir.glob(ext))
-                        
-                        if not files:
-                            # Check all files
-                            files = [f for f in temp_dir.glob('*') if f.is_file()]
+                    st.info(f"💡 File temporarily saved to: {file_path}")
+                
+                return True
+            elif download_success:
+                # Download reported success but file not found - search more thoroughly
+                st.warning("⚠️ Download reported success but file location unclear. Searching...")
+                try:
+                    latest_file = find_latest_download(temp_dir)
+                    if latest_file:
+                        file_size = latest_file.stat().st_size / (1024 * 1024)
                         
-                        if files:
-                            latest_file = max(files, key=lambda p: p.stat().st_mtime)
-                            file_size = latest_file.stat().st_size / (1024 * 1024)
-                            file_path = str(latest_file.resolve())
-                            
-                            if is_custom_folder:
-                                st.success(f"✅ File found!")
-                                st.info(f"📁 Location: {str(latest_file.parent)}")
-                                st.info(f"📄 File: {latest_file.name} ({file_size:.1f} MB)")
-                                try:
-                                    with open(latest_file, 'rb') as f:
-                                        file_data = f.read()
-                                    st.download_button(
-                                        label=f"⬇️ Download {latest_file.name} ({file_size:.1f} MB)",
-                                        data=file_data,
-                                        file_name=latest_file.name,
-                                        mime='application/octet-stream'
-                                    )
-                                except Exception:
-                                    pass
-                            else:
-                                with open(latest_file, 'rb') as f:
-                                    file_data = f.read()
+                        if is_custom_folder:
+                            st.success(f"✅ File found!")
+                            st.info(f"📁 Location: {str(latest_file.parent)}")
+                            st.info(f"📄 File: {latest_file.name} ({file_size:.1f} MB)")
+                        else:
+                            with open(latest_file, 'rb') as f:
                                 st.download_button(
                                     label=f"⬇️ Download {latest_file.name} ({file_size:.1f} MB)",
-                                    data=file_data,
+                                    data=f,
                                     file_name=latest_file.name,
                                     mime='application/octet-stream'
                                 )
-                            return True
-                    except Exception as e:
-                        logger.error(f"Error finding file: {e}")
-                        st.error(f"❌ Could not locate downloaded file. Error: {str(e)}")
-                
-                st.error("❌ Download completed but file not found. This might be due to format issues.")
-                return False
+                        return True
+                except Exception as e:
+                    logger.error(f"Error finding file: {e}")
+                    st.error(f"❌ Could not locate downloaded file. Error: {str(e)}")
             
+            st.error("❌ Download completed but file not found. This might be due to format issues.")
             return False
 
         finally:
@@ -593,6 +930,50 @@ def download_content(url: str, output_path: str, download_type: str = 'video', q
         logger.error(f"Download error: {e}")
         return False
 
+# Known-folder ID for the user's Downloads folder on Windows
+FOLDERID_DOWNLOADS = '{374DE290-123F-4565-9164-39C4925E467B}'
+
+def get_downloads_folder() -> str:
+    """Return the user's Downloads folder, honouring Windows folder redirection."""
+    if SYSTEM == "Windows":
+        try:
+            import ctypes
+            import uuid
+            from ctypes import wintypes
+            # One shell call instead of reading the legacy "Shell Folders" registry entry
+            get_known_folder_path = ctypes.windll.shell32.SHGetKnownFolderPath
+            get_known_folder_path.argtypes = [
+                ctypes.c_char_p, wintypes.DWORD, wintypes.HANDLE, ctypes.POINTER(ctypes.c_wchar_p)
+            ]
+            path_ptr = ctypes.c_wchar_p()
+            folder_id = uuid.UUID(FOLDERID_DOWNLOADS).bytes_le
+            if get_known_folder_path(folder_id, 0, None, ctypes.byref(path_ptr)) == 0:
+                try:
+                    return path_ptr.value
+                finally:
+                    ctypes.windll.ole32.CoTaskMemFree(path_ptr)
+        except Exception as e:
+            logger.warning(f"Could not look up Downloads folder: {e}")
+    return os.path.expanduser("~/Downloads")
+
+@st.cache_data(show_spinner=False)
+def get_common_folders() -> dict:
+    """Return the quick-select download locations; they don't change during a session."""
+    return {
+        "Downloads": get_downloads_folder(),
+        "Desktop": os.path.expanduser("~/Desktop"),
+        "Documents": os.path.expanduser("~/Documents"),
+        "Custom Path": ""
+    }
+
+@st.cache_data(show_spinner=False)
+def get_default_download_folder() -> str:
+    """Return the user's Downloads folder if it is writable, otherwise an empty string."""
+    default_downloads = get_common_folders()["Downloads"]
+    if os.path.isdir(default_downloads) and os.access(default_downloads, os.W_OK):
+        return os.path.abspath(default_downloads)
+    return ""
+
 def main():
     st.set_page_config(
         page_title="YouTube Downloader", 
@@ -600,6 +981,9 @@ def main():
         layout="wide"
     )
     
+    # Load yt-dlp extractors in the background while the user fills in the form
+    start_yt_dlp_warm_up()
+    
     # Title and description
     st.title("🎥 YouTube Downloader")
     
@@ -621,21 +1005,12 @@ def main():
         st.subheader("📁 Download Folder Selection")
         
         # Show common download locations
-        common_folders = {
-            "Downloads": os.path.expanduser("~/Downloads"),
-            "Desktop": os.path.expanduser("~/Desktop"),
-            "Documents": os.path.expanduser("~/Documents"),
-            "Custom Path": ""
-        }
+        common_folders = get_common_folders()
         
         # Initialize session state with Downloads folder as default
         if 'selected_folder' not in st.session_state:
             # Set default to Downloads folder if it exists, otherwise empty
-            default_downloads = common_folders["Downloads"]
-            if os.path.exists(default_downloads) and os.path.isdir(default_downloads) and os.access(default_downloads, os.W_OK):
-                st.session_state.selected_folder = os.path.abspath(default_downloads)
-            else:
-                st.session_state.selected_folder = ""
+            st.session_state.selected_folder = get_default_download_folder()
         
         # Quick selection buttons
         st.write("**Quick Select:**")
@@ -686,11 +1061,7 @@ def main():
                 st.info("💡 Try using the quick select buttons above, or leave empty to use temporary location")
                 # Reset to default if current selection is invalid
                 if normalized_path == st.session_state.selected_folder:
-                    default_downloads = common_folders["Downloads"]
-                    if os.path.exists(default_downloads) and os.path.isdir(default_downloads) and os.access(default_downloads, os.W_OK):
-                        st.session_state.selected_folder = os.path.abspath(default_downloads)
-                    else:
-                        st.session_state.selected_folder = ""
+                    st.session_state.selected_folder = get_default_download_folder()
             elif not os.path.isdir(normalized_path):
                 st.error(f"❌ Path is not a directory: {normalized_path}")
             elif not os.access(normalized_path, os.W_OK):
@@ -722,15 +1093,22 @@ def main():
             download_type = st.selectbox("📥 Download Type:", ["video", "audio"])
         with col2:
             if download_type == "video":
-                quality_options = [None, 240, 360, 480, 720, 1080]
                 quality = st.selectbox(
                     "🎬 Video Quality:", 
-                    quality_options,
+                    VIDEO_QUALITIES,
                     format_func=lambda x: "Best" if x is None else f"{x}p"
                 )
             else:
                 quality = None
         
+        concurrent_fragments = st.slider(
+            "⚡ Parallel fragments:",
+            min_value=1,
+            max_value=16,
+            value=DEFAULT_CONCURRENT_FRAGMENTS,
+            help="Number of video fragments downloaded at the same time"
+        )
+        
         submit_button = st.form_submit_button("⬇️ Download")
     
     if submit_button:
@@ -743,7 +1121,8 @@ def main():
                     "temp_downloads",
                     download_type,
                     quality,
-                    download_folder
+                    download_folder,
+                    concurrent_fragments
                 )
             
             if success: